@@ -1,5 +1,6 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
@@ -54,17 +55,51 @@ st.markdown("""
 # ── Data Loading ────────────────────────────────────────────────────────────
 @st.cache_data
 def load_data():
-    df = pd.read_csv("listingdata_final_for_looker.csv")
-    df["date"] = pd.to_datetime(df["date"], dayfirst=True)
-    return df
+    df = pd.read_parquet("listingdata_final_for_looker.parquet")
+    # Date-major order lets the sidebar date range be sliced with searchsorted
+    df = df.sort_values(["date", "item_id"]).reset_index(drop=True)
+    for col in ["brand_name", "item_id", "category", "vertical", "subCategory", "superCategory"]:
+        df[col] = df[col].astype("category")
+    # to_numeric only downcasts floats when every value survives the round trip, so
+    # revenue keeps float64 if it carries paise. rating stays float64: float32(4.2)
+    # compares below a 4.2 slider threshold.
+    for col in ["revenue", "price"]:
+        df[col] = pd.to_numeric(df[col], downcast="float")
+    for col in ["rating_count", "variations_count"]:
+        df[col] = pd.to_numeric(df[col], downcast="integer")
+    # Deduplicated item-level view (revenue lives at item_id level, not variant)
+    item_df = df.drop_duplicates(subset=["item_id", "date"]).reset_index(drop=True)
+    # Sidebar option lists for the full date range, built once per process
+    brand_to_skus = {
+        brand: sorted(g["item_id"].unique())
+        for brand, g in item_df.groupby("brand_name", observed=True)
+    }
+    return df, item_df, brand_to_skus
 
 
-raw = load_data()
+@st.cache_data
+def load_snapshots(_dtypes):
+    """Item-level rows for the latest date and the date nearest 4 weeks before it (from the ETL).
+
+    ``_dtypes`` are the long table's dtypes (categories, downcasts), applied so both
+    paths compute identically; they are fixed per process, so not hashed.
+    """
+    snap_latest = pd.read_parquet("snap_latest.parquet").astype(_dtypes)
+    snap_prev = pd.read_parquet("snap_prev.parquet").astype(_dtypes)
+    return snap_latest, snap_prev
+
+
+def slice_dates(df, date_start, date_end):
+    """Rows of a date-sorted frame with date_start <= date <= date_end."""
+    dates = df["date"].to_numpy()
+    lo = dates.searchsorted(date_start.to_datetime64(), "left")
+    hi = dates.searchsorted(date_end.to_datetime64(), "right")
+    return df.iloc[lo:hi]
 
-LATEST_DATE = raw["date"].max()
 
-# Deduplicated item-level view (revenue lives at item_id level, not variant)
-item_df = raw.drop_duplicates(subset=["item_id", "date"]).copy()
+raw, item_df, brand_to_skus = load_data()
+
+LATEST_DATE = raw["date"].max()
 
 # ── Sidebar Filters ─────────────────────────────────────────────────────────
 st.sidebar.markdown("## Filters")
@@ -110,13 +145,18 @@ if date_start > date_end:
     st.sidebar.error("Start Date must be before End Date.")
     st.stop()
 
-item_df = item_df[(item_df["date"] >= date_start) & (item_df["date"] <= date_end)]
+n_items = len(item_df)
+item_df = slice_dates(item_df, date_start, date_end)
+full_range = len(item_df) == n_items
 LATEST_DATE = item_df["date"].max()
 FOUR_W_AGO = LATEST_DATE - pd.Timedelta(weeks=4)
-nearest_4w = item_df["date"].unique()
-nearest_4w = pd.Timestamp(min(nearest_4w, key=lambda d: abs(d - FOUR_W_AGO)))
+uniq_dates = np.asarray(item_df["date"].unique())
+nearest_4w = pd.Timestamp(uniq_dates[np.abs(uniq_dates - FOUR_W_AGO.to_datetime64()).argmin()])
 
-all_brands = sorted(item_df["brand_name"].unique())
+if full_range:
+    all_brands = list(brand_to_skus)
+else:
+    all_brands = item_df["brand_name"].cat.remove_unused_categories().cat.categories.tolist()
 sel_brands = st.sidebar.multiselect("Brand (leave empty = all)", all_brands, default=[], key="f_brands")
 active_brands = sel_brands if sel_brands else all_brands
 
@@ -124,11 +164,11 @@ rating_thresh = st.sidebar.slider("Min Rating Threshold", 1.0, 5.0, 4.0, 0.1, ke
 count_thresh = st.sidebar.slider("Min Rating Count Threshold", 0, 5000, 200, 50, key="f_count")
 growth_thresh = st.sidebar.slider("Growth % Threshold (High-Scaling)", 0, 100, 20, 5, key="f_growth")
 
-all_skus = sorted(item_df[item_df["brand_name"].isin(active_brands)]["item_id"].unique())
+if full_range:
+    all_skus = sorted(set().union(*(brand_to_skus[b] for b in active_brands)))
+else:
+    all_skus = sorted(item_df[item_df["brand_name"].isin(active_brands)]["item_id"].unique())
 sel_skus = st.sidebar.multiselect("SKU Selector (leave empty = all)", all_skus, default=[], key="f_skus")
-active_skus = sel_skus if sel_skus else all_skus
-
-filt = item_df[(item_df["brand_name"].isin(active_brands)) & (item_df["item_id"].isin(active_skus))]
 
 st.sidebar.markdown("---")
 st.sidebar.button("Clear Filters", use_container_width=True, on_click=_clear_filters)
@@ -144,40 +184,117 @@ def fmt_inr(v):
     return f"₹{v:,.0f}"
 
 
+def fmt_inr_series(s):
+    """Format a numeric Series like fmt_inr in a single pass over its values."""
+    v = s.to_numpy(dtype=float)
+    a = np.abs(v)
+    buckets = [a >= 1e7, a >= 1e5, a >= 1e3]
+    scale = np.select(buckets, [1e7, 1e5, 1e3], default=1.0)
+    fmts = np.select(buckets, ["₹{:.2f} Cr", "₹{:.2f} L", "₹{:.1f} K"], default="₹{:,.0f}")
+    return pd.Series([f.format(x) for f, x in zip(fmts, v / scale)], index=s.index)
+
+
 # ── KPI Computation ─────────────────────────────────────────────────────────
-latest = filt[filt["date"] == LATEST_DATE]
-prev = filt[filt["date"] == nearest_4w]
-
-total_rev_latest = latest["revenue"].sum()
-total_rev_4w = prev["revenue"].sum()
-growth_pct = ((total_rev_latest - total_rev_4w) / total_rev_4w * 100) if total_rev_4w else 0
-
-risky = latest[(latest["rating"] < rating_thresh) & (latest["rating_count"] > count_thresh)]
-rev_at_risk = risky["revenue"].sum()
-
-# Per-SKU growth
-sku_latest = latest.groupby("item_id").agg(
-    revenue_latest=("revenue", "first"),
-    rating=("rating", "first"),
-    rating_count=("rating_count", "first"),
-    brand_name=("brand_name", "first"),
-    title=("title", "first"),
-).reset_index()
-
-sku_prev = prev.groupby("item_id").agg(revenue_4w=("revenue", "first")).reset_index()
-sku_merged = sku_latest.merge(sku_prev, on="item_id", how="left")
-sku_merged["growth_pct"] = sku_merged.apply(
-    lambda r: ((r["revenue_latest"] - r["revenue_4w"]) / r["revenue_4w"] * 100)
-    if pd.notna(r["revenue_4w"]) and r["revenue_4w"] > 0 else None, axis=1
-)
+def _select(df, sel_brands, sel_skus):
+    if sel_brands:
+        df = df[df["brand_name"].isin(sel_brands)]
+    if sel_skus:
+        df = df[df["item_id"].isin(sel_skus)]
+    return df
 
-high_scaling = sku_merged[
-    (sku_merged["growth_pct"] > growth_thresh) & (sku_merged["rating"] >= rating_thresh)
-]
-high_scaling_count = len(high_scaling)
-high_scaling_rev = high_scaling["revenue_latest"].sum()
 
-avg_rating = latest["rating"].mean() if len(latest) else 0
+@st.cache_data(max_entries=16)
+def compute_snapshots(_filt, date_start, date_end, latest_date, nearest_4w, sel_brands, sel_skus):
+    """Build the latest / 4-week snapshots and per-SKU comparison for one selection.
+
+    ``_filt`` is the filtered item-level view and is not hashed (nor returned, so
+    cache hits only unpickle the small snapshot frames); the cache is keyed on the
+    date range and selections, so sel_brands/sel_skus must be tuples.
+    """
+    # The ETL snapshots cover the full date range; narrower ranges fall back to a scan
+    snap_latest, snap_prev = load_snapshots(_filt.dtypes.to_dict())
+    if (len(snap_latest) and len(snap_prev) and snap_latest["date"].iloc[0] == latest_date
+            and snap_prev["date"].iloc[0] == nearest_4w):
+        latest = _select(snap_latest, sel_brands, sel_skus)
+        prev = _select(snap_prev, sel_brands, sel_skus)
+    else:
+        latest = _filt[_filt["date"] == latest_date]
+        prev = _filt[_filt["date"] == nearest_4w]
+
+    total_rev_latest = latest["revenue"].sum()
+    total_rev_4w = prev["revenue"].sum()
+
+    # Per-SKU growth (item_df is unique per item_id + date, so each snapshot has one row per SKU)
+    sku_latest = latest[["item_id", "revenue", "rating", "rating_count", "brand_name", "title"]].rename(
+        columns={"revenue": "revenue_latest"}
+    ).reset_index(drop=True)
+
+    # Keyed lookup instead of a merge; reindex rather than .map so a one-to-one
+    # mapping over the categorical item_id doesn't come back as a categorical.
+    sku_prev = prev.set_index("item_id")["revenue"]
+    sku_merged = sku_latest.assign(
+        revenue_4w=sku_prev.reindex(sku_latest["item_id"]).to_numpy()
+    )
+    prev_ok = sku_merged["revenue_4w"].gt(0)
+    sku_merged["growth_pct"] = np.where(
+        prev_ok,
+        (sku_merged["revenue_latest"] - sku_merged["revenue_4w"]) / sku_merged["revenue_4w"] * 100,
+        np.nan,
+    )
+
+    return {
+        "latest": latest,
+        "total_rev_latest": total_rev_latest,
+        "total_rev_4w": total_rev_4w,
+        "growth_pct": ((total_rev_latest - total_rev_4w) / total_rev_4w * 100) if total_rev_4w else 0,
+        "sku_merged": sku_merged,
+        "avg_rating": latest["rating"].mean() if len(latest) else 0,
+    }
+
+
+@st.cache_data(max_entries=64)
+def compute_kpis(_latest, _sku_merged, date_start, date_end, sel_brands, sel_skus,
+                 rating_thresh, count_thresh, growth_thresh):
+    """Apply the rating/count/growth thresholds to one filtered selection.
+
+    ``_latest`` and ``_sku_merged`` come from compute_snapshots and are not hashed;
+    the cache is keyed on the same selection plus the thresholds.
+    """
+    risky = _latest[(_latest["rating"] < rating_thresh) & (_latest["rating_count"] > count_thresh)]
+    high_scaling = _sku_merged[
+        (_sku_merged["growth_pct"] > growth_thresh) & (_sku_merged["rating"] >= rating_thresh)
+    ]
+    return {
+        "risky": risky,
+        "rev_at_risk": risky["revenue"].sum(),
+        "high_scaling": high_scaling,
+        "high_scaling_rev": high_scaling["revenue_latest"].sum(),
+    }
+
+
+# At most two masks (none when both selections are empty), so not worth caching:
+# st.cache_data would unpickle the whole frame on every hit
+filt = _select(item_df, sel_brands, sel_skus)
+
+snaps = compute_snapshots(
+    filt, date_start, date_end, LATEST_DATE, nearest_4w, tuple(sel_brands), tuple(sel_skus),
+)
+latest = snaps["latest"]
+total_rev_latest = snaps["total_rev_latest"]
+total_rev_4w = snaps["total_rev_4w"]
+growth_pct = snaps["growth_pct"]
+sku_merged = snaps["sku_merged"]
+avg_rating = snaps["avg_rating"]
+
+kpis = compute_kpis(
+    latest, sku_merged, date_start, date_end, tuple(sel_brands), tuple(sel_skus),
+    rating_thresh, count_thresh, growth_thresh,
+)
+risky = kpis["risky"]
+rev_at_risk = kpis["rev_at_risk"]
+high_scaling = kpis["high_scaling"]
+high_scaling_count = len(high_scaling)
+high_scaling_rev = kpis["high_scaling_rev"]
 
 # ── Title ───────────────────────────────────────────────────────────────────
 st.markdown(
@@ -264,13 +381,29 @@ with tab_overview:
     )
 
     scatter_data = sku_merged.dropna(subset=["growth_pct"]).copy()
-    scatter_data["size_val"] = scatter_data["revenue_latest"].clip(lower=1)
-    scatter_data["risk_label"] = scatter_data.apply(
-        lambda r: "At Risk" if r["rating"] < rating_thresh and r["rating_count"] > count_thresh
-        else ("High-Scaling" if r["growth_pct"] > growth_thresh and r["rating"] >= rating_thresh
-              else "Stable"), axis=1
+    # Revenue quantile bins keep the bubble-size payload to small integers
+    scatter_data["size_val"] = pd.qcut(
+        scatter_data["revenue_latest"].clip(lower=1), q=20, labels=False, duplicates="drop"
+    ).fillna(0).astype(int) + 5
+    risk_conds = [
+        (scatter_data["rating"] < rating_thresh) & (scatter_data["rating_count"] > count_thresh),
+        (scatter_data["growth_pct"] > growth_thresh) & (scatter_data["rating"] >= rating_thresh),
+    ]
+    # Null ratings/counts never match, as with the scalar comparisons this replaced
+    scatter_data["risk_label"] = np.select(
+        [c.to_numpy(dtype=bool, na_value=False) for c in risk_conds],
+        ["At Risk", "High-Scaling"], default="Stable",
     )
 
+    # On wide portfolios keep every flagged SKU and subsample only the Stable ones
+    if len(scatter_data) > 2000:
+        is_stable = scatter_data["risk_label"] == "Stable"
+        stable = scatter_data[is_stable]
+        n_stable = min(len(stable), max(2000 - int((~is_stable).sum()), 0))
+        scatter_data = pd.concat(
+            [scatter_data[~is_stable], stable.sample(n=n_stable, random_state=0)]
+        ).sort_index()
+
     color_map = {"At Risk": "#ef4444", "High-Scaling": "#22c55e", "Stable": "#6b7280"}
     fig_scatter = px.scatter(
         scatter_data, x="growth_pct", y="revenue_latest",
@@ -304,12 +437,13 @@ with tab_brand:
         unsafe_allow_html=True,
     )
 
-    brand_rev = latest.groupby("brand_name")["revenue"].sum().reset_index()
+    brand_rev = latest.groupby("brand_name", sort=False, observed=True)["revenue"].sum().reset_index()
     brand_rev = brand_rev.sort_values("revenue", ascending=True)
     brand_rev["pct"] = brand_rev["revenue"] / brand_rev["revenue"].sum() * 100
 
-    brand_rev["label"] = brand_rev.apply(
-        lambda r: f"Rev: {fmt_inr(r['revenue'])} | Share: {r['pct']:.1f}%", axis=1
+    brand_rev["label"] = (
+        "Rev: " + fmt_inr_series(brand_rev["revenue"])
+        + " | Share: " + brand_rev["pct"].map("{:.1f}%".format)
     )
     fig_brand = px.bar(
         brand_rev, y="brand_name", x="revenue", orientation="h",
@@ -361,7 +495,7 @@ with tab_risk:
 
     risky_display = risky[["item_id", "brand_name", "title", "revenue", "rating",
                            "rating_count"]].copy()
-    risky_display["revenue"] = risky_display["revenue"].apply(fmt_inr)
+    risky_display["revenue"] = fmt_inr_series(risky_display["revenue"])
     risky_display.columns = ["Item ID", "Brand", "Title", "Revenue", "Rating", "Review Count"]
 
     if len(risky_display):
@@ -371,12 +505,16 @@ with tab_risk:
 
     # Declining SKUs (negative growth)
     st.markdown("### Declining SKUs (Negative 4W Growth)")
-    declining = sku_merged[sku_merged["growth_pct"] < 0].sort_values("growth_pct")
+    is_declining = sku_merged["growth_pct"] < 0
+    declining = sku_merged.loc[is_declining].nsmallest(100, "growth_pct")
     if len(declining):
+        n_declining = int(is_declining.sum())
+        if n_declining > len(declining):
+            st.caption(f"Showing the {len(declining)} steepest of {n_declining} declining SKUs.")
         dec_display = declining[["item_id", "brand_name", "title", "revenue_latest",
                                  "revenue_4w", "growth_pct", "rating"]].copy()
-        dec_display["revenue_latest"] = dec_display["revenue_latest"].apply(fmt_inr)
-        dec_display["revenue_4w"] = dec_display["revenue_4w"].apply(fmt_inr)
+        dec_display["revenue_latest"] = fmt_inr_series(dec_display["revenue_latest"])
+        dec_display["revenue_4w"] = fmt_inr_series(dec_display["revenue_4w"])
         dec_display["growth_pct"] = dec_display["growth_pct"].apply(lambda v: f"{v:+.1f}%")
         dec_display.columns = ["Item ID", "Brand", "Title", "Rev (Latest)", "Rev (4W Ago)",
                                "4W Growth", "Rating"]
@@ -408,8 +546,8 @@ with tab_growth:
                                     "revenue_4w", "growth_pct", "rating",
                                     "rating_count"]].copy()
         hs_display = hs_display.sort_values("growth_pct", ascending=False)
-        hs_display["revenue_latest"] = hs_display["revenue_latest"].apply(fmt_inr)
-        hs_display["revenue_4w"] = hs_display["revenue_4w"].apply(fmt_inr)
+        hs_display["revenue_latest"] = fmt_inr_series(hs_display["revenue_latest"])
+        hs_display["revenue_4w"] = fmt_inr_series(hs_display["revenue_4w"])
         hs_display["growth_pct"] = hs_display["growth_pct"].apply(lambda v: f"{v:+.1f}%")
         hs_display.columns = ["Item ID", "Brand", "Title", "Rev (Latest)", "Rev (4W Ago)",
                                "4W Growth", "Rating", "Review Count"]
@@ -427,14 +565,35 @@ with tab_growth:
     if len(stars):
         stars_disp = stars[["item_id", "brand_name", "title", "revenue_latest",
                             "growth_pct", "rating", "rating_count"]].copy()
-        stars_disp["revenue_latest"] = stars_disp["revenue_latest"].apply(fmt_inr)
+        stars_disp["revenue_latest"] = fmt_inr_series(stars_disp["revenue_latest"])
         stars_disp["growth_pct"] = stars_disp["growth_pct"].apply(lambda v: f"{v:+.1f}%")
         stars_disp.columns = ["Item ID", "Brand", "Title", "Revenue", "4W Growth",
                               "Rating", "Review Count"]
         st.dataframe(stars_disp, use_container_width=True, hide_index=True)
 
 # ─── TAB 5: Trend Explorer ──────────────────────────────────────────────────
-with tab_trend:
+@st.cache_data
+def compute_trend(_filt, _raw, date_start, date_end, sel_brands, sel_skus, trend_items):
+    """Per-date revenue and average price for the Trend Explorer.
+
+    ``_filt`` (the filtered item-level view) and ``_raw`` are not hashed; like
+    compute_kpis, the cache is keyed on the filter values, which must be tuples.
+    """
+    if trend_items:
+        trend_data = _filt[_filt["item_id"].isin(trend_items)]
+        trend_agg = trend_data.groupby(["date", "item_id"], sort=False, observed=True)["revenue"].first().reset_index()
+    else:
+        trend_agg = _filt.groupby("date")["revenue"].sum().reset_index()
+
+    price_trend = _select(slice_dates(_raw, date_start, date_end), sel_brands, sel_skus)
+    if trend_items:
+        price_trend = price_trend[price_trend["item_id"].isin(trend_items)]
+    price_agg = price_trend.groupby("date")["price"].mean().reset_index()
+    return trend_agg, price_agg
+
+
+@st.fragment
+def render_trend_tab(filt, raw, date_start, date_end, sel_brands, sel_skus):
     st.markdown("### Revenue Trend Over Time")
     st.markdown(
         '<div class="insight-box"><strong>Why it matters:</strong> Weekly trend reveals '
@@ -449,16 +608,16 @@ with tab_trend:
         options=sorted(filt["item_id"].unique()),
         default=[],
     )
+    trend_agg, price_agg = compute_trend(
+        filt, raw, date_start, date_end, sel_brands, sel_skus, tuple(trend_items),
+    )
 
     if trend_items:
-        trend_data = filt[filt["item_id"].isin(trend_items)].copy()
-        trend_agg = trend_data.groupby(["date", "item_id"])["revenue"].first().reset_index()
         fig_trend = px.line(
             trend_agg, x="date", y="revenue", color="item_id",
             labels={"date": "Date", "revenue": "Revenue (₹)", "item_id": "SKU"},
         )
     else:
-        trend_agg = filt.groupby("date")["revenue"].sum().reset_index()
         fig_trend = px.area(
             trend_agg, x="date", y="revenue",
             labels={"date": "Date", "revenue": "Total Revenue (₹)"},
@@ -475,13 +634,6 @@ with tab_trend:
 
     # Price trend
     st.markdown("### Price Movement")
-    price_trend = raw[
-        raw["item_id"].isin(active_skus) & raw["brand_name"].isin(active_brands)
-        & (raw["date"] >= date_start) & (raw["date"] <= date_end)
-    ]
-    if trend_items:
-        price_trend = price_trend[price_trend["item_id"].isin(trend_items)]
-    price_agg = price_trend.groupby("date")["price"].mean().reset_index()
     fig_price = px.line(price_agg, x="date", y="price",
                         labels={"date": "Date", "price": "Avg Price (₹)"})
     fig_price.update_traces(line_color="#f59e0b")
@@ -493,6 +645,10 @@ with tab_trend:
     st.plotly_chart(fig_price, use_container_width=True)
 
 
+with tab_trend:
+    render_trend_tab(filt, raw, date_start, date_end, tuple(sel_brands), tuple(sel_skus))
+
+
 # ── Footer ──────────────────────────────────────────────────────────────────
 st.markdown("---")
 st.caption(
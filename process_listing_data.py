@@ -1,6 +1,11 @@
-import pandas as pd
 import json
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import sys
+from numba import njit
 
 
 def safe_parse_json(raw):
@@ -9,6 +14,13 @@ def safe_parse_json(raw):
         return None
     if isinstance(raw, (dict, list)):
         return raw
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        pass
+    except TypeError:
+        return None
+    # orjson rejects the NaN/Infinity literals the stdlib parser accepts
     try:
         return json.loads(raw)
     except (json.JSONDecodeError, TypeError):
@@ -35,26 +47,86 @@ def extract_page_content_fields(raw):
     }
 
 
+def extract_page_content_df(df):
+    """Build item_id, title, category, vertical, subCategory, superCategory rows from page_content."""
+    page_content_df = pd.DataFrame(df["page_content"].map(extract_page_content_fields).tolist())
+    page_content_df.insert(0, "item_id", df["item_id"].to_numpy())
+    return page_content_df
+
+
+def read_source_chunks(path, block_size=64 << 20):
+    """
+    Stream the source CSV as Arrow-backed DataFrames of roughly block_size bytes.
+    Only the columns the ETL uses are read; block_size must exceed the largest row.
+    """
+    column_types = {
+        "item_id": pa.string(),
+        "unique_identifier": pa.string(),
+        "brand_name": pa.string(),
+        "rating": pa.float64(),
+        "rating_count": pa.int64(),
+        "variations_count": pa.int64(),
+        "page_content": pa.string(),
+        "monthly_revenue_history": pa.string(),
+        "promotion_history": pa.string(),
+    }
+    reader = pacsv.open_csv(
+        path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(
+            column_types=column_types, include_columns=list(column_types),
+            strings_can_be_null=True,  # empty fields become null, as with pd.read_csv
+        ),
+    )
+    for batch in reader:
+        yield batch.to_pandas(types_mapper=pd.ArrowDtype)
+
+
+def _coerce_history_entry(entry, value_key):
+    """Coerce one history entry to a string date and float value, using None for anything unparseable."""
+    date = entry.get("date")
+    value = entry.get(value_key)
+    try:
+        value = None if value is None else float(value)
+    except (TypeError, ValueError, OverflowError):
+        value = None
+    return {"date": date if isinstance(date, str) else None, value_key: value}
+
+
+def _flatten_history(df, column, value_key, value_name):
+    """
+    Explode a JSON array column into one row per entry of:
+    item_id, date, <value_name> (renamed from value_key).
+    """
+    entry_type = pa.struct([("date", pa.string()), (value_key, pa.float64())])
+    lists = []
+    for raw in df[column]:
+        parsed = safe_parse_json(raw)
+        if isinstance(parsed, list):
+            lists.append([
+                _coerce_history_entry(entry, value_key) for entry in parsed if isinstance(entry, dict)
+            ])
+        else:
+            lists.append(None)
+    arr = pa.array(lists, type=pa.list_(entry_type))
+
+    # Repeat each row's item_id once per entry, then pull the struct fields as columns
+    lengths = arr.value_lengths().fill_null(0).to_numpy()
+    item_ids = pa.array(df["item_id"]).take(np.repeat(np.arange(len(arr)), lengths))
+    entries = arr.flatten()
+    table = pa.Table.from_arrays(
+        [item_ids, entries.field("date"), entries.field(value_key)],
+        names=["item_id", "date", value_name],
+    )
+    return table.to_pandas()
+
+
 def flatten_revenue_history(df):
     """
     Parse monthly_revenue_history JSON arrays and flatten into rows of:
     item_id, date, revenue (renamed from avg_monthly_revenue).
     """
-    records = []
-    for _, row in df.iterrows():
-        item_id = row["item_id"]
-        parsed = safe_parse_json(row["monthly_revenue_history"])
-        if parsed is None or not isinstance(parsed, list):
-            continue
-        for entry in parsed:
-            if not isinstance(entry, dict):
-                continue
-            records.append({
-                "item_id": item_id,
-                "date": entry.get("date"),
-                "revenue": entry.get("avg_monthly_revenue"),
-            })
-    return pd.DataFrame(records)
+    return _flatten_history(df, "monthly_revenue_history", "avg_monthly_revenue", "revenue")
 
 
 def flatten_promotion_history(df):
@@ -62,52 +134,53 @@ def flatten_promotion_history(df):
     Parse promotion_history JSON arrays and flatten into rows of:
     item_id, date, price (renamed from value).
     """
-    records = []
-    for _, row in df.iterrows():
-        item_id = row["item_id"]
-        parsed = safe_parse_json(row["promotion_history"])
-        if parsed is None or not isinstance(parsed, list):
-            continue
-        for entry in parsed:
-            if not isinstance(entry, dict):
-                continue
-            records.append({
-                "item_id": item_id,
-                "date": entry.get("date"),
-                "price": entry.get("value"),
-            })
-    return pd.DataFrame(records)
+    return _flatten_history(df, "promotion_history", "value", "price")
 
 
-def main():
-    # STEP 1: Load the CSV
-    input_path = "listingdata (1).csv"
-    print(f"Loading CSV: {input_path}")
-    df = pd.read_csv(input_path)
-    print(f"  Loaded {len(df)} rows, {len(df.columns)} columns")
+@njit(cache=True)
+def ffill_groups(codes, values):
+    """Forward fill NaNs in values in place, restarting whenever codes changes (rows sorted by group)."""
+    last = np.nan
+    last_code = -1
+    for i in range(len(codes)):
+        if codes[i] != last_code:
+            last = np.nan
+            last_code = codes[i]
+        if np.isnan(values[i]):
+            values[i] = last
+        else:
+            last = values[i]
 
-    # STEP 2: Parse page_content and extract selected fields
-    print("Parsing page_content JSON...")
-    page_content_extracted = df["page_content"].apply(extract_page_content_fields)
-    page_content_df = pd.DataFrame(page_content_extracted.tolist())
-    page_content_df["item_id"] = df["item_id"].values
-    page_content_df = page_content_df[["item_id", "title", "category", "vertical", "subCategory", "superCategory"]]
 
+def main():
+    # STEP 1-4: Stream the CSV in chunks, extracting page_content fields and
+    # flattening revenue/promotion history per chunk so only one chunk of raw
+    # JSON is held in memory at a time
+    input_path = "listingdata (1).csv"
+    print(f"Streaming CSV: {input_path}")
     metadata_cols = ["item_id", "unique_identifier", "brand_name", "rating", "rating_count", "variations_count"]
-    metadata_df = df[metadata_cols].drop_duplicates(subset=["item_id"], keep="first").reset_index(drop=True)
+    page_content_parts, metadata_parts, revenue_parts, promotion_parts = [], [], [], []
+    n_rows = 0
+    for chunk in read_source_chunks(input_path):
+        n_rows += len(chunk)
+        page_content_parts.append(extract_page_content_df(chunk))
+        metadata_parts.append(chunk[metadata_cols])
+        revenue_parts.append(flatten_revenue_history(chunk))
+        promotion_parts.append(flatten_promotion_history(chunk))
+    print(f"  Loaded {n_rows} rows in {len(revenue_parts)} chunk(s)")
+
+    metadata_df = pd.concat(metadata_parts, ignore_index=True)
+    metadata_df = metadata_df.drop_duplicates(subset=["item_id"], keep="first").reset_index(drop=True)
 
+    page_content_df = pd.concat(page_content_parts, ignore_index=True)
     page_content_df = page_content_df.drop_duplicates(subset=["item_id"], keep="first").reset_index(drop=True)
     page_content_df = pd.merge(page_content_df, metadata_df, on="item_id", how="left")
     print(f"  Extracted page_content + metadata for {len(page_content_df)} unique items")
 
-    # STEP 3: Flatten revenue_history
-    print("Flattening revenue history...")
-    revenue_df = flatten_revenue_history(df)
+    revenue_df = pd.concat(revenue_parts, ignore_index=True)
     print(f"  Revenue rows: {len(revenue_df)}")
 
-    # STEP 4: Flatten promotion_history
-    print("Flattening promotion history...")
-    promotion_df = flatten_promotion_history(df)
+    promotion_df = pd.concat(promotion_parts, ignore_index=True)
     print(f"  Promotion rows: {len(promotion_df)}")
 
     # STEP 5: Convert date columns to datetime
@@ -125,7 +198,10 @@ def main():
     # STEP 7: Forward fill price per item_id where price is null
     print("Forward filling price per item_id...")
     merged_df = merged_df.sort_values(by=["item_id", "date"]).reset_index(drop=True)
-    merged_df["price"] = merged_df.groupby("item_id")["price"].ffill()
+    codes, _ = pd.factorize(merged_df["item_id"])
+    price = merged_df["price"].to_numpy(dtype=np.float64, copy=True)
+    ffill_groups(codes, price)
+    merged_df["price"] = price
 
     # STEP 8: Merge with page_content fields on item_id
     print("Merging with page_content fields...")
@@ -155,11 +231,36 @@ def main():
     print("Sorting by item_id and date...")
     final_df = final_df.sort_values(by=["item_id", "date"], ascending=[True, True]).reset_index(drop=True)
 
-    # STEP 11: Save to CSV
+    # Arrow-backed dtypes stay inside the ETL; outputs get plain numpy dtypes with NaN nulls
+    for col in final_df.columns:
+        if isinstance(final_df[col].dtype, (pd.ArrowDtype, pd.StringDtype)):
+            final_df[col] = final_df[col].to_numpy(na_value=np.nan)
+    final_df = final_df.infer_objects()
+
+    # STEP 11: Save to Parquet (dashboard) and CSV (Looker export)
+    parquet_path = "listingdata_final_for_looker.parquet"
+    print(f"Saving to {parquet_path}...")
+    final_df.to_parquet(parquet_path, engine="pyarrow", compression="snappy", index=False)
+    print(f"  Saved {len(final_df)} rows to {parquet_path}")
+
     output_path = "listingdata_final_for_looker.csv"
     print(f"Saving to {output_path}...")
     final_df.to_csv(output_path, index=False)
     print(f"  Saved {len(final_df)} rows to {output_path}")
+
+    # STEP 12: Save item-level snapshots for the latest date and the date nearest
+    # 4 weeks before it, so dashboard KPIs don't have to scan the long table
+    print("Saving latest / 4-week snapshots...")
+    item_df = final_df.drop_duplicates(subset=["item_id", "date"])
+    latest_date = item_df["date"].max()
+    # Sorted, like the dashboard's date-ordered view, so argmin breaks ties the same way
+    dates = np.unique(item_df["date"].dropna().to_numpy())
+    four_w_ago = (latest_date - pd.Timedelta(weeks=4)).to_datetime64()
+    prev_date = dates[np.abs(dates - four_w_ago).argmin()]
+    for snap_path, snap_date in [("snap_latest.parquet", latest_date), ("snap_prev.parquet", prev_date)]:
+        snap = item_df[item_df["date"] == snap_date]
+        snap.to_parquet(snap_path, engine="pyarrow", compression="snappy", index=False)
+        print(f"  Saved {len(snap)} rows to {snap_path}")
     print("Done.")
 
 